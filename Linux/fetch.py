@@ -20,23 +20,15 @@ import sys
 from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
 
+import config  # noqa: F401  (puts ../common on sys.path)
+import profiling
+from versions import max_per_group
+
 
 # =========================
 # HELPERS (rarely change)
 # =========================
 
-def version_key(v: str, width: int = 4):
-    """Normalize versions for comparison (handles 1–4+ numeric segments)."""
-    parts = []
-    for x in v.split("."):
-        try:
-            parts.append(int(x))
-        except ValueError:
-            parts.append(0)
-    if len(parts) < width:
-        parts += [0] * (width - len(parts))
-    return tuple(parts[:width])
-
 def _safe_get_news_list(payload):
     """Diwa key name can vary; support a few likely variants."""
     for key in (
@@ -137,29 +129,9 @@ DISTROS = {
 # GENERIC FETCHER
 # =========================
 
-def fetch_latest_for_distro(
-    diwa_base: str,
-    distro_cfg: dict,
-    timeout_sec: int = 20,
-):
-    slug   = distro_cfg["slug"]
-    title  = distro_cfg["title"]
-    target = distro_cfg.get("target_majors")  # set[str] or None
-    allow  = distro_cfg.get("allowed_prefixes", {})
-    regex  = distro_cfg.get("version_regex") or _build_release_regex(title)
-
-    endpoint = f"{diwa_base.rstrip('/')}/{slug}"
-
-    try:
-        with urlopen(endpoint, timeout=timeout_sec) as r:
-            raw = r.read().decode("utf-8", "replace")
-        payload = json.loads(raw)
-    except (URLError, HTTPError, json.JSONDecodeError) as e:
-        print(f"[ERR] fetch failed from {endpoint}: {e}", file=sys.stderr)
-        return None
-
-    items = _safe_get_news_list(payload)
-    latest_by_major = {}
+def _latest_by_major(items, regex, target, allow) -> dict:
+    """Keep the highest release per major from Diwa news items."""
+    candidates = []  # (major, version, text, url)
 
     for it in items:
         if not isinstance(it, dict):
@@ -183,9 +155,40 @@ def fetch_latest_for_distro(
         if not _allowed_for_major(ver, major, allow):
             continue
 
-        cur = latest_by_major.get(major)
-        if (not cur) or (version_key(ver) > version_key(cur["version"])):
-            latest_by_major[major] = {"version": ver, "text": text, "url": url}
+        candidates.append((major, ver, text, url))
+
+    best = max_per_group(candidates, group=lambda c: c[0], version=lambda c: c[1])
+    return {major: {"version": ver, "text": text, "url": url} for major, (_, ver, text, url) in best.items()}
+
+
+def fetch_latest_for_distro(
+    diwa_base: str,
+    distro_cfg: dict,
+    timeout_sec: int = 20,
+):
+    slug   = distro_cfg["slug"]
+    title  = distro_cfg["title"]
+    target = distro_cfg.get("target_majors")  # set[str] or None
+    allow  = distro_cfg.get("allowed_prefixes", {})
+    regex  = distro_cfg.get("version_regex") or _build_release_regex(title)
+
+    endpoint = f"{diwa_base.rstrip('/')}/{slug}"
+
+    try:
+        with profiling.stage("fetch"):
+            with urlopen(endpoint, timeout=timeout_sec) as r:
+                raw = r.read().decode("utf-8", "replace")
+    except (URLError, HTTPError) as e:
+        print(f"[ERR] fetch failed from {endpoint}: {e}", file=sys.stderr)
+        return None
+
+    with profiling.stage("parse"):
+        try:
+            payload = json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"[ERR] fetch failed from {endpoint}: {e}", file=sys.stderr)
+            return None
+        latest_by_major = _latest_by_major(_safe_get_news_list(payload), regex, target, allow)
 
     return {"source": endpoint, "series": latest_by_major}
 
@@ -195,6 +198,7 @@ def fetch_latest_for_distro(
 # =========================
 
 def main():
+    profiling.enable_from_argv()
     DIWA_BASE   = os.environ.get("DIWA_BASE", "http://127.0.0.1:8000/api/distribution")
     DISTRO_KEY  = os.environ.get("DIWA_DISTRO", "ubuntu").lower()
     OUTFILE     = os.environ.get("OUTFILE", f"{DISTRO_KEY}_releases.json")
@@ -1,8 +1,46 @@
-from shipper import ship_linux_distribution_series
-import json
-from config import API_KEY_B64, DEST_INDEX, ES_URL
+from config import API_KEY_B64, DEST_INDEX, ES_URL, DIWA_BASE, FETCH_CONCURRENCY, MONOTONIC_UPSERTS, ROLLUP_INDEX
+from shipper import linux_heartbeat_action, linux_series_actions, update_latest_rollup
+from fetch import DISTROS, fetch_latest_for_distro
+from bulk import ensure_upsert_script, make_bulk_sender
+from lease import Coordinator
+import profiling
+from pipeline import BulkPipeline, fetch_concurrently
+from breaker import RunDeadline, guarded_fetch
+
+
+def fetch_distro(distro_key: str, deadline: RunDeadline):
+    # Per-distro breaker; falls back to that distro's last good payload. Returns (payload, fresh).
+    return guarded_fetch(
+        f"diwa-{distro_key}",
+        lambda timeout_sec: fetch_latest_for_distro(DIWA_BASE, DISTROS[distro_key], timeout_sec=timeout_sec),
+        deadline=deadline,
+        timeout_cap=20,
+        valid=lambda payload: bool(payload.get("series")),
+    )
+
+
 if __name__ == "__main__":
-    # Suppose you loaded your JSON into `payload` (dict) already:
-    with open("Linux/mint_releases.json", "r") as f:
-        payload = json.load(f)
-    ship_linux_distribution_series(payload, api_key_b64=API_KEY_B64, es_url=ES_URL, dest_index=DEST_INDEX)  # index: linux_latest_version
+    profiling.enable_from_argv()  # --profile[=DIR]
+    # Each DISTROS entry is one source; live runners split them between themselves.
+    # Distros are fetched in parallel and shipped in the background as each one completes.
+    sender = make_bulk_sender(es_url=ES_URL, api_key_b64=API_KEY_B64, refresh="wait_for")
+    ensure_upsert_script(MONOTONIC_UPSERTS, ES_URL, API_KEY_B64)
+    deadline = RunDeadline()
+    shipped = []
+    with Coordinator("linux") as coord, BulkPipeline(sender) as pipe:
+        tasks = [(key, deadline) for key in coord.assigned(DISTROS)]
+        for _, (payload, fresh) in fetch_concurrently(fetch_distro, tasks, max_workers=FETCH_CONCURRENCY):
+            if payload is None:
+                continue
+            with profiling.stage("build"):
+                actions = list(linux_series_actions(payload, dest_index=DEST_INDEX, monotonic=MONOTONIC_UPSERTS))  # index: linux_latest_version
+            pipe.submit_all(actions)
+            shipped.append(payload)
+            heartbeat = linux_heartbeat_action(payload, fresh=fresh)
+            if heartbeat:
+                pipe.submit(*heartbeat)
+    print(f"[DONE] Upserted {pipe.total} linux doc(s) into '{DEST_INDEX}'. Failures: {pipe.failed}")
+
+    # One GET-able "current latest" doc for dashboards, rewritten only when a section changed
+    if ROLLUP_INDEX and shipped and not pipe.failed:
+        update_latest_rollup(shipped, DEST_INDEX)
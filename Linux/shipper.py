@@ -1,106 +1,12 @@
-import datetime
-import time
 import re
-from typing import Optional, List, Tuple, Dict
-from typing import Dict, Tuple, Any, Optional
-import os
-import json
-import time
 from datetime import datetime, timezone
-from typing import Optional, List, Tuple, Dict
-
-import requests
-# If you keep per-OS indexes in config:
-# from config import linux_dest_index as LINUX_DEST_INDEX
-# Otherwise set a sane default here:
-# --------------------------------
-
-def _bulk_flush(
-    actions: List[dict],
-    docs: List[dict],
-    es_url: str,
-    api_key_b64: str,
-    refresh: Optional[str],
-    max_retries: int,
-    retry_backoff_sec: float,
-) -> Tuple[int, int]:
-    """
-    Sends one NDJSON bulk request.
-    Returns (num_indexed_attempted, num_failed_items).
-    Supports any bulk op (index/update/create/delete) in `actions`.
-    """
-    if not actions:
-        return (0, 0)
-
-    headers = {
-        "Authorization": f"ApiKey {api_key_b64}",
-        "Content-Type": "application/x-ndjson",
-    }
+from itertools import chain
+from typing import Dict, Iterator, List, Tuple, Any, Optional
 
-    bulk_url = f"{es_url.rstrip('/')}/_bulk"
-    if refresh is not None:
-        bulk_url += f"?refresh={'true' if refresh is True else 'false' if refresh is False else refresh}"
-
-    # Prepare NDJSON payload
-    lines = []
-    for meta, doc in zip(actions, docs):
-        lines.append(json.dumps(meta, separators=(",", ":")))
-        # For delete ops there is no source line; but we only send bodies for ops that expect them
-        op = next(iter(meta))
-        if op in ("index", "create", "update"):
-            lines.append(json.dumps(doc, separators=(",", ":")))
-    payload = "\n".join(lines) + "\n"
-
-    # Retry transient issues (429/5xx)
-    last_resp = None
-    for attempt in range(1, max_retries + 1):
-        resp = requests.post(bulk_url, data=payload, headers=headers, timeout=120)
-        last_resp = resp
-        if resp.status_code == 429 or 500 <= resp.status_code < 600:
-            sleep_for = retry_backoff_sec * (2 ** (attempt - 1))
-            print(f"[WARN] Bulk HTTP {resp.status_code} attempt {attempt}/{max_retries}; "
-                  f"backing off {sleep_for:.1f}s")
-            time.sleep(sleep_for)
-            continue
-        break
-
-    if last_resp is None or not last_resp.ok:
-        msg = f"Bulk failed: HTTP {getattr(last_resp, 'status_code', '???')} {getattr(last_resp, 'text', '')[:500]}"
-        raise RuntimeError(msg)
-
-    result = last_resp.json()
-    failed = 0
-    if result.get("errors"):
-        for i, item in enumerate(result.get("items", [])):
-            # item looks like {"update": {"_index":"...","_id":"...","status":200,...}}
-            op = next(iter(item))
-            ent = item.get(op, {})
-            err = ent.get("error")
-            if err:
-                failed += 1
-                if failed <= 10:
-                    print(f"[ERROR] item #{i} failed: op={op} status={ent.get('status')} "
-                          f"_id={ent.get('_id')} error={err}")
-    else:
-        took = result.get("took")
-        print(f"[OK] Bulk sent {len(actions)} ops in {took} ms")
-
-    # Count ops we attempted (one per meta)
-    return (len(actions), failed)
-
-
-def _parse_version_parts(version: str) -> Tuple[int, int, int]:
-    """
-    Parse versions like '25.10', '24.04.3', '22.04.5' -> (major, minor, patch).
-    Missing parts default to 0. Extra parts are ignored.
-    """
-    m = re.match(r"^\s*(\d+)(?:\.(\d+))?(?:\.(\d+))?", str(version))
-    if not m:
-        return (0, 0, 0)
-    major = int(m.group(1))
-    minor = int(m.group(2) or 0)
-    patch = int(m.group(3) or 0)
-    return major, minor, patch
+from config import DEST_INDEX, MONOTONIC_UPSERTS, ROLLUP_INDEX
+from bulk import content_upsert, ensure_upsert_script, heartbeat_action, make_bulk_sender, monotonic_upsert
+from versions import parse_version
+from rollup import update_rollup, read_section
 
 
 def _infer_distro_name(payload: Dict[str, Any], fallback: Optional[str] = None) -> str:
@@ -114,6 +20,99 @@ def _infer_distro_name(payload: Dict[str, Any], fallback: Optional[str] = None)
     return (m.group(1) if m else "unknown").lower()
 
 
+def linux_heartbeat_action(
+    payload: Dict[str, Any],
+    *,
+    distro: Optional[str] = None,
+    fresh: bool = True,
+) -> Optional[Tuple[dict, dict]]:
+    """heartbeat_action() for one fetch.py payload (_id "linux-<distro>")."""
+    series_map = (payload or {}).get("series") or {}
+    distro_name = _infer_distro_name(payload, fallback=distro)
+    return heartbeat_action(f"linux-{distro_name}", os_name="linux", source=payload.get("source"),
+                            docs_checked=len(series_map) if isinstance(series_map, dict) else 0, fresh=fresh)
+
+
+def linux_series_actions(
+    payload: Dict[str, Any],
+    *,
+    distro: Optional[str] = None,
+    dest_index: Optional[str] = None,
+    monotonic: bool = False,
+) -> Iterator[Tuple[dict, dict]]:
+    """
+    Yield one bulk (meta, body) UPDATE (upsert; no-op when unchanged) per series in a fetch.py payload.
+    monotonic=True: never lower major/minor/patch, nor replace a release with a pre-release
+    of it (call ensure_upsert_script() first).
+    """
+    series_map = (payload or {}).get("series") or {}
+    if not isinstance(series_map, dict):
+        return
+
+    distro_name = _infer_distro_name(payload, fallback=distro)
+    source_url = payload.get("source")
+
+    now_iso = datetime.now(timezone.utc).isoformat()
+
+    # one UPDATE (upsert) per series
+    for series_key, info in series_map.items():
+        try:
+            series_int = int(str(series_key).strip())
+        except ValueError:
+            # skip weird keys
+            continue
+
+        version = str((info or {}).get("version", "")).strip()
+        text = (info or {}).get("text")
+        ann_url = (info or {}).get("url")
+
+        parsed = parse_version(version)
+        major, minor, patch = parsed.parts()
+
+        _id = f"{distro_name}-{series_int}"  # ensures one doc per distro/series
+
+        doc_body = {
+            "distro": distro_name,
+            "series": series_int,
+            "latest_version": version,
+            "major": major,
+            "minor": minor,
+            "patch": patch,
+            "is_final": int(not parsed.is_prerelease),
+            "text": text,
+            "announcement_url": ann_url,
+            "source": source_url,
+        }
+
+        meta = {"update": {"_index": dest_index, "_id": _id}}
+        if monotonic:
+            yield meta, monotonic_upsert(doc_body, now_iso, ["major", "minor", "patch", "is_final"])
+        else:
+            yield meta, content_upsert(doc_body, now_iso)
+
+
+def update_latest_rollup(payloads: List[Dict[str, Any]], dest_index: Optional[str] = None) -> bool:
+    """
+    Rebuild the "linux.<distro>" section of the rollup doc for each shipped payload.
+    Only the payload's own series are read, so series that left it drop out of the section.
+    """
+    dest_index = dest_index or DEST_INDEX
+    sections = {}
+    for payload in payloads:
+        name = _infer_distro_name(payload)
+        ids = []
+        for series_key in (payload.get("series") or {}):
+            try:
+                ids.append(f"{name}-{int(str(series_key).strip())}")
+            except ValueError:
+                continue  # skipped by linux_series_actions too
+        sections[("linux", name)] = read_section(
+            dest_index, {"ids": {"values": sorted(ids)}}, "series",
+            ["latest_version", "major", "minor", "patch", "announcement_url", "version_changed_at"],
+        )
+    return update_rollup(sections) if sections else False
+
+
 def ship_linux_distribution_series(
     payload: Dict[str, Any],
     *,
@@ -125,6 +124,7 @@ def ship_linux_distribution_series(
     batch_size: int = 500,
     max_retries: int = 3,
     retry_backoff_sec: float = 1.0,
+    monotonic: Optional[bool] = None,
 ) -> None:
     """
     Upsert one document per (distro, series) from a payload like:
@@ -144,70 +144,39 @@ def ship_linux_distribution_series(
       - latest_version (string), major/minor/patch (ints)
       - text, announcement_url
       - source
-      - updated_at, @timestamp  (identical)
-    """
-    from config import ES_URL, API_KEY_B64  # reuse your existing config
-
-    es_url = es_url or ES_URL
-    api_key_b64 = api_key_b64 or API_KEY_B64
-    dest_index = dest_index 
+      - version_changed_at, @timestamp  (set only when the doc's content changes)
 
+    The run itself is recorded in one heartbeat doc per distro (_id "linux-<distro>").
+    monotonic=True (default: MONOTONIC_UPSERTS) uses the stored monotonic script,
+    so an older version never wins.
+    """
     series_map = (payload or {}).get("series") or {}
     if not isinstance(series_map, dict) or not series_map:
         print("[INFO] Nothing to ship: 'series' is empty.")
         return
 
-    distro_name = _infer_distro_name(payload, fallback=distro)
-    source_url = payload.get("source")
-
-    now_iso = datetime.now(timezone.utc).isoformat()
+    if monotonic is None:
+        monotonic = MONOTONIC_UPSERTS
+    ensure_upsert_script(monotonic, es_url, api_key_b64)
+    flush_fn = make_bulk_sender(
+        es_url=es_url, api_key_b64=api_key_b64, refresh=refresh,
+        max_retries=max_retries, retry_backoff_sec=retry_backoff_sec,
+    )
     actions, docs = [], []
     total = 0
     total_failed = 0
 
     def flush():
         nonlocal actions, docs, total, total_failed
-        n_attempted, n_failed = _bulk_flush(
-            actions, docs, es_url, api_key_b64, refresh, max_retries, retry_backoff_sec
-        )
+        n_attempted, n_failed = flush_fn(actions, docs)
         total += n_attempted
         total_failed += n_failed
         actions.clear()
         docs.clear()
 
-    # one UPDATE (upsert) per series
-    for series_key, info in series_map.items():
-        try:
-            series_int = int(str(series_key).strip())
-        except ValueError:
-            # skip weird keys
-            continue
-
-        version = str((info or {}).get("version", "")).strip()
-        text = (info or {}).get("text")
-        ann_url = (info or {}).get("url")
-
-        major, minor, patch = _parse_version_parts(version)
-
-        _id = f"{distro_name}-{series_int}"  # ensures one doc per distro/series
-
-        doc_body = {
-            "distro": distro_name,
-            "series": series_int,
-            "latest_version": version,
-            "major": major,
-            "minor": minor,
-            "patch": patch,
-            "text": text,
-            "announcement_url": ann_url,
-            "source": source_url,
-            "updated_at": now_iso,
-            "@timestamp": now_iso,
-        }
-
-        meta = {"update": {"_index": dest_index, "_id": _id}}
-        body = {"doc": doc_body, "doc_as_upsert": True, "detect_noop": True}
-
+    heartbeat = linux_heartbeat_action(payload, distro=distro)
+    for meta, body in chain(linux_series_actions(payload, distro=distro, dest_index=dest_index, monotonic=monotonic),
+                            filter(None, [heartbeat])):
         actions.append(meta)
         docs.append(body)
 
@@ -218,3 +187,6 @@ def ship_linux_distribution_series(
         flush()
 
     print(f"[DONE] Upserted {total} linux doc(s) into '{dest_index}'. Failures: {total_failed}")
+
+    if ROLLUP_INDEX and not total_failed:
+        update_latest_rollup([payload], dest_index)
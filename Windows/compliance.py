@@ -0,0 +1,338 @@
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from config import (
+    ES_URL, API_KEY_B64, SOURCE_INDEX, DEST_INDEX, COMPLIANCE_INDEX,
+    HOST_FIELD, BUILD_FIELD, UBR_FIELD, INVENTORY_PAGE_SIZE, COMPLIANCE_UBQ_RPS, COMPLIANCE_UBQ_TIMEOUT_SEC,
+)
+from pipeline import BulkPipeline
+import profiling
+from bulk import make_bulk_sender
+
+try:
+    import numpy as np
+except ImportError:  # optional: without numpy the same arrays are compared in a plain loop
+    np = None
+
+# Fleet compliance: which hosts in SOURCE_INDEX are behind the latest UBR of their build.
+#
+# - The inventory is streamed with a point-in-time + search_after, in large pages that
+#   only carry the three doc-value fields we need (no _source).
+# - Each page becomes three parallel arrays (host, build, ubr); the latest UBR is looked
+#   up in a dense table indexed by build prefix, so the join is one vectorised gather.
+# - Results go back through the background bulk pipeline while the next page is read.
+#
+# Compliance doc (_id = host):
+#   {"host": "pc-01", "build_prefix": 26100, "ubr": 6584, "current_build": "26100.6584",
+#    "latest_ubr": 6899, "latest_build": "26100.6899", "ubr_lag": 315, "compliant": false,
+#    "tracked": true, "checked_at": "..."}
+
+_MAX_PREFIX = 100_000  # build prefixes are 5 digits
+
+
+def _headers() -> dict:
+    return {"Authorization": f"ApiKey {API_KEY_B64}", "Content-Type": "application/json"}
+
+
+def es_request(method: str, path: str, body: Optional[dict] = None, params: Optional[dict] = None) -> dict:
+    resp = requests.request(
+        method, f"{ES_URL.rstrip('/')}/{path.lstrip('/')}",
+        json=body, params=params, headers=_headers(), timeout=120,
+    )
+    if not resp.ok:
+        raise RuntimeError(f"{method} {path} failed: HTTP {resp.status_code} {resp.text[:500]}")
+    return resp.json() if resp.content else {}
+
+
+def split_build(build, ubr) -> Tuple[int, int]:
+    """(build_prefix, ubr) from doc values; -1 for anything missing or unparseable."""
+    b = str(build[0] if isinstance(build, list) else build or "")
+    u = ubr[0] if isinstance(ubr, list) and ubr else ubr
+    prefix, _, tail = b.partition(".")
+    try:
+        p = int(prefix)
+    except ValueError:
+        p = -1
+    try:
+        u = int(u if u is not None else tail)
+    except (TypeError, ValueError):
+        u = -1
+    return p, u
+
+
+def shipped_latest_builds(index: str = DEST_INDEX) -> Dict[int, int]:
+    """Read back {build_prefix: latest_ubr} from the docs ship_latest_builds wrote."""
+    res = es_request("POST", f"{index}/_search", {
+        "size": 1000,
+        "_source": ["build_prefix", "latest_ubr"],
+        "query": {"match": {"os": "windows11"}},
+    })
+    latest = {}
+    for hit in (res.get("hits") or {}).get("hits") or []:
+        src = hit.get("_source") or {}
+        if src.get("build_prefix") is not None and src.get("latest_ubr") is not None:
+            latest[int(src["build_prefix"])] = int(src["latest_ubr"])
+    return latest
+
+
+def iter_inventory_pages(
+    index: str = SOURCE_INDEX,
+    *,
+    page_size: int = INVENTORY_PAGE_SIZE,
+    keep_alive: str = "5m",
+) -> Iterator[Tuple[List[str], array, array]]:
+    """Yield (hosts, build_prefixes, ubrs) per page of the host inventory."""
+    fields = [HOST_FIELD, BUILD_FIELD] + ([UBR_FIELD] if UBR_FIELD else [])
+    pit_id = es_request("POST", f"{index}/_pit", params={"keep_alive": keep_alive})["id"]
+    search_after = None
+    try:
+        while True:
+            body = {
+                "size": page_size,
+                "_source": False,
+                "docvalue_fields": fields,
+                "track_total_hits": False,
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": [{"_shard_doc": "asc"}],
+                "query": {"exists": {"field": HOST_FIELD}},
+            }
+            if search_after is not None:
+                body["search_after"] = search_after
+            with profiling.stage("fetch"):
+                res = es_request("POST", "_search", body,
+                                 params={"filter_path": "pit_id,hits.hits.fields,hits.hits.sort"})
+            pit_id = res.get("pit_id", pit_id)
+            hits = (res.get("hits") or {}).get("hits") or []
+            if not hits:
+                return
+
+            hosts: List[str] = []
+            builds, ubrs = array("i"), array("i")
+            for h in hits:
+                f = h.get("fields") or {}
+                host = f.get(HOST_FIELD)
+                if not host:
+                    continue
+                p, u = split_build(f.get(BUILD_FIELD), f.get(UBR_FIELD) if UBR_FIELD else None)
+                hosts.append(str(host[0]))
+                builds.append(p)
+                ubrs.append(u)
+            yield hosts, builds, ubrs
+
+            search_after = hits[-1]["sort"]
+            if len(hits) < page_size:
+                return
+    finally:
+        try:
+            es_request("DELETE", "_pit", {"id": pit_id})
+        except (RuntimeError, requests.RequestException) as e:
+            print(f"[WARN] could not close PIT: {e}", file=sys.stderr)
+
+
+def latest_lookup(latest_by_build: Dict[int, int]) -> array:
+    """Dense table: lut[build_prefix] = latest_ubr, -1 for untracked prefixes."""
+    lut = array("i", [-1]) * _MAX_PREFIX
+    for prefix, ubr in latest_by_build.items():
+        if 0 <= int(prefix) < _MAX_PREFIX:
+            lut[int(prefix)] = int(ubr)
+    return lut
+
+
+def compute_lag(lut: array, builds: array, ubrs: array) -> Tuple[array, array]:
+    """
+    Returns (latest_ubr, ubr_lag) arrays for one page.
+    latest_ubr is -1 for untracked / unknown builds, and ubr_lag is -1 there too.
+    """
+    if np is not None:
+        lut_np = np.frombuffer(lut, dtype=np.int32)
+        b = np.frombuffer(builds, dtype=np.int32)
+        u = np.frombuffer(ubrs, dtype=np.int32)
+        known = (b >= 0) & (b < _MAX_PREFIX)
+        latest = np.where(known, lut_np[np.clip(b, 0, _MAX_PREFIX - 1)], -1).astype(np.int32)
+        lag = np.where((latest >= 0) & (u >= 0), np.maximum(latest - u, 0), -1).astype(np.int32)
+        return array("i", latest.tobytes()), array("i", lag.tobytes())
+
+    latest, lag = array("i"), array("i")
+    for b, u in zip(builds, ubrs):
+        lt = lut[b] if 0 <= b < _MAX_PREFIX else -1
+        latest.append(lt)
+        lag.append(max(lt - u, 0) if lt >= 0 and u >= 0 else -1)
+    return latest, lag
+
+
+def compliance_actions(
+    hosts: List[str],
+    builds: array,
+    ubrs: array,
+    latest: array,
+    lag: array,
+    dest_index: str,
+    checked_at: str,
+) -> Iterator[Tuple[dict, dict]]:
+    for host, b, u, lt, lg in zip(hosts, builds, ubrs, latest, lag):
+        doc = {
+            "host": host,
+            "build_prefix": b if b >= 0 else None,
+            "ubr": u if u >= 0 else None,
+            "current_build": f"{b}.{u}" if b >= 0 and u >= 0 else None,
+            "latest_ubr": lt if lt >= 0 else None,
+            "latest_build": f"{b}.{lt}" if lt >= 0 else None,
+            "ubr_lag": lg if lg >= 0 else None,
+            "compliant": lg == 0,
+            "tracked": lt >= 0,
+            "checked_at": checked_at,
+            "@timestamp": checked_at,
+        }
+        yield {"index": {"_index": dest_index, "_id": host}}, doc
+
+
+def run_compliance(
+    latest_by_build: Dict[int, int],
+    *,
+    source_index: str = SOURCE_INDEX,
+    dest_index: str = COMPLIANCE_INDEX,
+    page_size: int = INVENTORY_PAGE_SIZE,
+) -> Tuple[int, int]:
+    """Recompute one compliance doc per host; returns (docs written, failures)."""
+    if not source_index or not dest_index:
+        raise RuntimeError("SOURCE_INDEX and COMPLIANCE_INDEX must be set")
+    if not latest_by_build:
+        print("[INFO] Nothing to compare against: latest_by_build is empty.")
+        return (0, 0)
+
+    lut = latest_lookup(latest_by_build)
+    checked_at = datetime.now(timezone.utc).isoformat()
+    # No per-batch refresh: this is a large background write
+    with BulkPipeline(make_bulk_sender(refresh=None), batch_size=5000) as pipe:
+        for hosts, builds, ubrs in iter_inventory_pages(source_index, page_size=page_size):
+            with profiling.stage("compare"):
+                latest, lag = compute_lag(lut, builds, ubrs)
+            with profiling.stage("build"):
+                actions = list(compliance_actions(hosts, builds, ubrs, latest, lag, dest_index, checked_at))
+            pipe.submit_all(actions)
+
+    print(f"[DONE] Wrote {pipe.total} compliance doc(s) into '{dest_index}'. Failures: {pipe.failed}")
+    return pipe.total, pipe.failed
+
+
+
+# ---------- incremental refresh ----------
+#
+# When ship_latest_builds moves a prefix to a new latest_ubr, only hosts on that prefix
+# change. Instead of a full run, the stored script below recomputes their docs in place with
+# one throttled, sliced _update_by_query over COMPLIANCE_INDEX.
+#
+# The docs to touch are picked from COMPLIANCE_INDEX itself: on a shipped prefix, but not
+# yet on its shipped latest_ubr. A refresh that failed or never ran is therefore picked up
+# again by the next run.
+
+LAG_SCRIPT_ID = "windows-compliance-lag"
+
+_LAG_SCRIPT = """
+def latest = params.latest[String.valueOf(ctx._source.build_prefix)];
+if (latest == null) { ctx.op = 'noop'; return; }
+ctx._source.latest_ubr = latest;
+ctx._source.latest_build = ctx._source.build_prefix + '.' + latest;
+ctx._source.tracked = true;
+if (ctx._source.ubr == null) {
+  ctx._source.ubr_lag = null;
+  ctx._source.compliant = false;
+} else {
+  long lag = Math.max((long) latest - (long) ctx._source.ubr, 0L);
+  ctx._source.ubr_lag = lag;
+  ctx._source.compliant = lag == 0L;
+}
+ctx._source.checked_at = params.now;
+ctx._source['@timestamp'] = params.now;
+"""
+
+
+def stale_query(latest: Dict[int, int]) -> dict:
+    """Compliance docs on a shipped prefix whose latest_ubr is not that prefix's shipped UBR."""
+    return {"bool": {"minimum_should_match": 1, "should": [
+        {"bool": {"filter": [{"term": {"build_prefix": p}}], "must_not": [{"term": {"latest_ubr": u}}]}}
+        for p, u in sorted(latest.items())
+    ]}}
+
+
+def wait_for_task(task_id: str, poll_sec: float = 5.0, timeout_sec: float = COMPLIANCE_UBQ_TIMEOUT_SEC) -> dict:
+    """
+    Poll a background task, printing progress; returns its final response.
+    After timeout_sec the task is cancelled and RuntimeError is raised.
+    """
+    deadline = time.monotonic() + timeout_sec
+    while True:
+        res = es_request("GET", f"_tasks/{task_id}")
+        status = (res.get("task") or {}).get("status") or {}
+        done = status.get("updated", 0) + status.get("noops", 0) + status.get("version_conflicts", 0)
+        print(f"[INFO] task {task_id}: {done}/{status.get('total', '?')} doc(s)")
+        if res.get("completed"):
+            if res.get("error"):
+                raise RuntimeError(f"task {task_id} failed: {res['error']}")
+            return res.get("response") or {}
+        if time.monotonic() >= deadline:
+            es_request("POST", f"_tasks/{task_id}/_cancel")
+            raise RuntimeError(f"task {task_id} still running after {timeout_sec:.0f}s; cancelled")
+        time.sleep(poll_sec)
+
+
+def refresh_stale_prefixes(
+    latest: Dict[int, int],
+    *,
+    dest_index: str = COMPLIANCE_INDEX,
+    requests_per_second: float = COMPLIANCE_UBQ_RPS,
+) -> int:
+    """Recompute compliance docs only for hosts whose latest_ubr differs from the shipped one."""
+    if not latest:
+        return 0
+    query = stale_query(latest)
+    stale = es_request("POST", f"{dest_index}/_count", {"query": query}).get("count", 0)
+    if not stale:
+        print("[INFO] No build prefix changed; compliance docs are current.")
+        return 0
+
+    es_request("PUT", f"_scripts/{LAG_SCRIPT_ID}", {"script": {"lang": "painless", "source": _LAG_SCRIPT}})
+    res = es_request(
+        "POST", f"{dest_index}/_update_by_query",
+        {
+            "query": query,
+            "script": {
+                "id": LAG_SCRIPT_ID,
+                "params": {
+                    "latest": {str(p): u for p, u in latest.items()},
+                    "now": datetime.now(timezone.utc).isoformat(),
+                },
+            },
+        },
+        params={
+            "slices": "auto",
+            "conflicts": "proceed",
+            "requests_per_second": requests_per_second,
+            "wait_for_completion": "false",
+            "refresh": "true",
+        },
+    )
+    print(f"[INFO] Refreshing {stale} stale compliance doc(s) (task {res['task']})")
+    response = wait_for_task(res["task"])
+    failures = response.get("failures") or []
+    for f in failures[:10]:
+        print(f"[ERROR] update_by_query failure: {f}")
+    print(f"[DONE] Updated {response.get('updated', 0)} compliance doc(s) in '{dest_index}'. "
+          f"Failures: {len(failures)}")
+    return int(response.get("updated", 0))
+
+if __name__ == "__main__":
+    profiling.enable_from_argv()  # --profile[=DIR]
+    from breaker import RunDeadline, guarded_fetch
+    from scrape_latest_build import fetch_ms_latest_builds
+
+    latest, _ = guarded_fetch("windows11-release-information", fetch_ms_latest_builds,
+                              deadline=RunDeadline(), timeout_cap=30)
+    if latest is None:
+        print(" No fresh data and no last good snapshot for the Microsoft page.", file=sys.stderr)
+        sys.exit(1)
+    run_compliance({int(k): int(v) for k, v in latest.items()})
@@ -1,12 +1,20 @@
 # config.py
 from pathlib import Path
 from dotenv import load_dotenv
-import os, re, ast
+import os, re, ast, sys
 
 # Always resolve path so it works no matter where you run from
 ENV_PATH = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=ENV_PATH)  # set override=True if you want .env to win over OS env
 
+# Code shared by the three pipelines lives in ../common and reads its settings from this
+# module, so every module here imports config before anything from common/. It goes first
+# on sys.path so an installed distribution with the same name (profiling, versions, ...)
+# can't shadow it; common/ has no config.py, so this folder's config still wins.
+COMMON_DIR = Path(__file__).resolve().parent.parent / "common"
+if str(COMMON_DIR) not in sys.path:
+    sys.path.insert(0, str(COMMON_DIR))
+
 def int_set_env(name: str, default: set[int] | None = None) -> set[int]:
     raw = os.getenv(name)
     if not raw:
@@ -34,3 +42,36 @@ API_KEY_B64 = os.getenv("API_KEY_B64")
 RELEASE_INFO_URL = os.getenv("RELEASE_INFO_URL")
 DEST_INDEX = os.getenv("DEST_INDEX")
 SUPPORTED_BUILDS: set[int] = int_set_env("SUPPORTED_BUILDS")
+
+# Running several runners side by side (see common/lease.py).
+# LEASE_INDEX unset -> single-host mode. LOCK_FILE guards overlapping runs on a host either way.
+LEASE_INDEX = os.getenv("LEASE_INDEX")
+LEASE_TTL_SEC = int(os.getenv("LEASE_TTL_SEC", "900"))  # keep above the schedule interval
+WORKER_ID = os.getenv("WORKER_ID")                      # defaults to the hostname
+LOCK_FILE = os.getenv("LOCK_FILE", str(Path(__file__).resolve().parent / ".runner.lock"))
+
+# Upstream protection (see common/breaker.py)
+STATE_DIR = os.getenv("STATE_DIR", str(Path(__file__).resolve().parent / ".state"))  # breaker state + last good snapshots
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))         # consecutive failures before opening
+BREAKER_COOLDOWN_SEC = int(os.getenv("BREAKER_COOLDOWN_SEC", "900"))  # open -> half-open probe after this
+RUN_DEADLINE_SEC = int(os.getenv("RUN_DEADLINE_SEC", "120"))       # total budget for all fetches in a run
+
+# Fleet compliance job (compliance.py): SOURCE_INDEX host inventory -> COMPLIANCE_INDEX
+COMPLIANCE_INDEX = os.getenv("COMPLIANCE_INDEX")
+HOST_FIELD = os.getenv("HOST_FIELD", "host.name")       # keyword; becomes the compliance doc _id
+BUILD_FIELD = os.getenv("BUILD_FIELD", "host.os.build")  # build prefix (26100) or full build ("26100.6899")
+UBR_FIELD = os.getenv("UBR_FIELD", "host.os.ubr")        # empty -> UBR is taken from a full BUILD_FIELD
+INVENTORY_PAGE_SIZE = int(os.getenv("INVENTORY_PAGE_SIZE", "10000"))
+SUMMARY_INDEX = os.getenv("SUMMARY_INDEX")  # summary.py: host counts per (build_prefix, UBR)
+COMPLIANCE_UBQ_RPS = float(os.getenv("COMPLIANCE_UBQ_RPS", "2000"))  # incremental refresh throttle (docs/s, -1 = off)
+COMPLIANCE_UBQ_TIMEOUT_SEC = int(os.getenv("COMPLIANCE_UBQ_TIMEOUT_SEC", "600"))  # cancel the refresh task after this
+
+# Liveness: one small "last checked" doc per source, kept out of the versioned content docs
+HEARTBEAT_INDEX = os.getenv("HEARTBEAT_INDEX") or (f"{DEST_INDEX}_heartbeat" if DEST_INDEX else None)
+
+# Scripted "monotonic max" upserts: a stale writer can never roll a version back
+MONOTONIC_UPSERTS = os.getenv("MONOTONIC_UPSERTS", "").strip().lower() in ("1", "true", "yes")
+
+# Cross-OS "current latest" rollup doc (see common/rollup.py); unset ROLLUP_INDEX to skip it
+ROLLUP_INDEX = os.getenv("ROLLUP_INDEX")
+ROLLUP_ID = os.getenv("ROLLUP_ID", "current")
@@ -1,9 +1,54 @@
+import sys
+
+import requests
+from config import DEST_INDEX, COMPLIANCE_INDEX, MONOTONIC_UPSERTS, RELEASE_INFO_URL, ROLLUP_INDEX
 from scrape_latest_build import fetch_ms_latest_builds
-from shipper import ship_latest_builds
-from config import DEST_INDEX
+from shipper import latest_build_actions, update_latest_rollup
+from bulk import ensure_upsert_script, heartbeat_action, make_bulk_sender
+from lease import Coordinator
+import profiling
+from pipeline import BulkPipeline
+from breaker import RunDeadline, guarded_fetch
+from compliance import refresh_stale_prefixes, shipped_latest_builds
+
+SOURCE = "windows11-release-information"
 
 if __name__ == "__main__":
-    
-    latest = fetch_ms_latest_builds()
-    ship_latest_builds(latest, dest_index=DEST_INDEX, refresh="wait_for")
-    
\ No newline at end of file
+    profiling.enable_from_argv()  # --profile[=DIR]
+
+    # One upstream page: whichever live runner owns it fetches and ships
+    latest = {}
+    with Coordinator("windows") as coord:
+        with BulkPipeline(make_bulk_sender(refresh="wait_for")) as pipe:
+            if coord.owns(SOURCE):
+                latest, fresh = guarded_fetch(SOURCE, fetch_ms_latest_builds, deadline=RunDeadline(), timeout_cap=30)
+                if latest is None:
+                    print(" No fresh data and no last good snapshot for the Microsoft page.", file=sys.stderr)
+                else:
+                    # snapshots round-trip through JSON, which turns the int keys into strings
+                    latest = {int(k): int(v) for k, v in latest.items()}
+                    ensure_upsert_script(MONOTONIC_UPSERTS)
+                    with profiling.stage("build"):
+                        actions = list(latest_build_actions(latest, dest_index=DEST_INDEX, monotonic=MONOTONIC_UPSERTS))
+                    pipe.submit_all(actions)
+                    heartbeat = heartbeat_action("windows11", os_name="windows11", source=RELEASE_INFO_URL,
+                                                 docs_checked=len(latest), fresh=fresh)
+                    if heartbeat:
+                        pipe.submit(*heartbeat)
+        print(f"[DONE] Upserted {pipe.total} build doc(s) into '{DEST_INDEX}'. Failures: {pipe.failed}")
+
+        # One GET-able "current latest" doc for dashboards, rewritten only when a section changed
+        if ROLLUP_INDEX and latest and not pipe.failed:
+            update_latest_rollup(latest, DEST_INDEX)
+
+        # Incremental compliance: only hosts not yet on their prefix's latest UBR are recomputed.
+        # Compared against what DEST_INDEX holds now, not the fetched map: in monotonic mode an
+        # older input (e.g. a last good snapshot) is a no-op there and must not regress hosts.
+        # A failed refresh only leaves hosts stale until the next run, so it must not fail this one.
+        if COMPLIANCE_INDEX and latest and not pipe.failed:
+            try:
+                refresh_stale_prefixes(shipped_latest_builds(DEST_INDEX))
+            except (RuntimeError, requests.RequestException) as e:
+                print(f"[WARN] Compliance refresh skipped: {e}", file=sys.stderr)
+    if latest is None:
+        sys.exit(1)
@@ -1,23 +1,33 @@
-import sys
 import requests
-import sys
 import re
 import html
 from config import RELEASE_INFO_URL, SUPPORTED_BUILDS
+import profiling
 
 # Scrape the table on Microsoft's 'Windows 11 release information' page.
 # Returns { build_prefix:int -> latest_ubr:int }, e.g. {22631: 6060, 26100: 6899, 26200: 6899}.
+# Raises RuntimeError on failure; main.py then falls back to the last good snapshot (see common/breaker.py).
 
-def fetch_ms_latest_builds():
+def fetch_ms_latest_builds(timeout_sec: float = 30):
     
     try:
-        r = requests.get(RELEASE_INFO_URL, timeout=30)
-        r.raise_for_status()
-        html_text = r.text
+        with profiling.stage("fetch"):
+            r = requests.get(RELEASE_INFO_URL, timeout=timeout_sec)
+            r.raise_for_status()
+            html_text = r.text
     except requests.RequestException as e:
-        print(f" Failed to fetch Microsoft page: {e}", file=sys.stderr)
-        sys.exit(1)
+        raise RuntimeError(f"Failed to fetch Microsoft page: {e}") from e
 
+    with profiling.stage("parse"):
+        latest_by_build = _parse_latest_builds(html_text)
+
+    if not latest_by_build:
+        raise RuntimeError("Could not parse 'Latest build' from Microsoft table.")
+
+    return latest_by_build
+
+
+def _parse_latest_builds(html_text: str):
     # Grab all tables
     tables = re.findall(r"<table.*?>.*?</table>", html_text, flags=re.I | re.S)
     latest_by_build = {}
@@ -57,8 +67,4 @@ def fetch_ms_latest_builds():
             if build_prefix in SUPPORTED_BUILDS:
                 latest_by_build[build_prefix] = max(ubr, latest_by_build.get(build_prefix, 0))
 
-    if not latest_by_build:
-        print(" Could not parse 'Latest build' from Microsoft table.", file=sys.stderr)
-        sys.exit(1)
-
     return latest_by_build
@@ -0,0 +1,127 @@
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Tuple
+
+from config import SOURCE_INDEX, DEST_INDEX, SUMMARY_INDEX, BUILD_FIELD, UBR_FIELD
+from compliance import es_request, split_build, shipped_latest_builds
+from bulk import make_bulk_sender
+import profiling
+
+# Build-distribution summary for dashboards: host counts per (build_prefix, UBR) and how far
+# each group is behind the latest_ubr that ship_latest_builds wrote to DEST_INDEX.
+#
+# Counting happens in the cluster with a paginated composite aggregation, so only one
+# bucket per distinct build comes back instead of one document per host.
+#
+# Summary doc (_id = "<build_prefix>.<ubr>"):
+#   {"build_prefix": 26100, "ubr": 6584, "current_build": "26100.6584", "host_count": 1234,
+#    "latest_ubr": 6899, "latest_build": "26100.6899", "ubr_lag": 315, "compliant": false,
+#    "tracked": true, "summarized_at": "..."}
+
+
+def iter_build_buckets(index: str = SOURCE_INDEX, page_size: int = 1000) -> Iterator[Tuple[int, int, int]]:
+    """Yield (build_prefix, ubr, host_count) over every composite bucket."""
+    sources = [{"build": {"terms": {"field": BUILD_FIELD}}}]
+    if UBR_FIELD:
+        sources.append({"ubr": {"terms": {"field": UBR_FIELD}}})
+    after = None
+    while True:
+        composite = {"size": page_size, "sources": sources}
+        if after is not None:
+            composite["after"] = after
+        res = es_request(
+            "POST", f"{index}/_search",
+            {"size": 0, "track_total_hits": False, "aggs": {"builds": {"composite": composite}}},
+            params={"filter_path": "aggregations.builds.after_key,aggregations.builds.buckets"},
+        )
+        agg = (res.get("aggregations") or {}).get("builds") or {}
+        for b in agg.get("buckets") or []:
+            key = b["key"]
+            prefix, ubr = split_build(key.get("build"), key.get("ubr"))
+            yield prefix, ubr, int(b["doc_count"])
+        after = agg.get("after_key")
+        if not after:
+            return
+
+
+def summary_actions(
+    latest_by_build: Dict[int, int],
+    dest_index: str,
+    summarized_at: str,
+    *,
+    source_index: str = SOURCE_INDEX,
+) -> Iterator[Tuple[dict, dict]]:
+    # With a full-build BUILD_FIELD and no UBR_FIELD several terms can map to the
+    # same (prefix, ubr), so merge counts before emitting
+    counts: Dict[Tuple[int, int], int] = {}
+    for prefix, ubr, n in iter_build_buckets(source_index):
+        counts[(prefix, ubr)] = counts.get((prefix, ubr), 0) + n
+
+    for (prefix, ubr), n in sorted(counts.items()):
+        if prefix < 0 or ubr < 0:
+            continue
+        latest = latest_by_build.get(prefix)
+        lag = max(latest - ubr, 0) if latest is not None else None
+        doc = {
+            "build_prefix": prefix,
+            "ubr": ubr,
+            "current_build": f"{prefix}.{ubr}",
+            "host_count": n,
+            "latest_ubr": latest,
+            "latest_build": f"{prefix}.{latest}" if latest is not None else None,
+            "ubr_lag": lag,
+            "compliant": lag == 0,
+            "tracked": latest is not None,
+            "summarized_at": summarized_at,
+            "@timestamp": summarized_at,
+        }
+        meta = {"update": {"_index": dest_index, "_id": f"{prefix}.{ubr}"}}
+        yield meta, {"doc": doc, "doc_as_upsert": True, "detect_noop": True}
+
+
+def run_summary(
+    *,
+    source_index: str = SOURCE_INDEX,
+    latest_index: str = DEST_INDEX,
+    dest_index: str = SUMMARY_INDEX,
+) -> Tuple[int, int]:
+    """Upsert one summary doc per (build_prefix, UBR) and drop groups no host is on anymore."""
+    if not source_index or not dest_index:
+        raise RuntimeError("SOURCE_INDEX and SUMMARY_INDEX must be set")
+
+    latest_by_build = shipped_latest_builds(latest_index)
+    summarized_at = datetime.now(timezone.utc).isoformat()
+    flush_fn = make_bulk_sender(refresh="wait_for")
+
+    actions, docs = [], []
+    total = 0
+    total_failed = 0
+    for meta, body in summary_actions(latest_by_build, dest_index, summarized_at, source_index=source_index):
+        actions.append(meta)
+        docs.append(body)
+        if len(actions) >= 500:
+            n_attempted, n_failed = flush_fn(actions, docs)
+            total, total_failed = total + n_attempted, total_failed + n_failed
+            actions.clear()
+            docs.clear()
+    if actions:
+        n_attempted, n_failed = flush_fn(actions, docs)
+        total, total_failed = total + n_attempted, total_failed + n_failed
+
+    if not total_failed:
+        # Groups not seen in this run have no hosts left on them
+        es_request("POST", f"{dest_index}/_delete_by_query",
+                   {"query": {"range": {"summarized_at": {"lt": summarized_at}}}},
+                   params={"conflicts": "proceed", "refresh": "true"})
+
+    print(f"[DONE] Upserted {total} build summary doc(s) into '{dest_index}'. Failures: {total_failed}")
+    return total, total_failed
+
+
+if __name__ == "__main__":
+    profiling.enable_from_argv()  # --profile[=DIR]
+    try:
+        run_summary()
+    except RuntimeError as e:
+        print(f" {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,178 @@
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from config import BREAKER_COOLDOWN_SEC, BREAKER_FAILURES, RUN_DEADLINE_SEC, STATE_DIR
+
+# Keeps a slow or failing upstream from stalling the whole run.
+#
+# - RunDeadline caps the total fetch time of a run. Every socket timeout is clipped to what
+#   is left, and guarded_fetch() stops waiting for a fetch once the deadline passes, so
+#   retries or a slow trickle of bytes can't stretch one fetch past it either.
+# - CircuitBreaker (one per source, persisted in STATE_DIR so it survives between runs):
+#     closed    -> fetch normally; BREAKER_FAILURES consecutive failures open it
+#     open      -> skip the upstream until BREAKER_COOLDOWN_SEC has passed
+#     half_open -> let one probe through; success closes it, failure re-opens it
+# - While a source is skipped or failing, guarded_fetch() serves the last good parsed
+#   snapshot of that source from STATE_DIR instead.
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class RunDeadline:
+    def __init__(self, total_sec: Optional[float] = None) -> None:
+        self.total_sec = float(total_sec if total_sec is not None else RUN_DEADLINE_SEC)
+        self.started = time.monotonic()
+
+    def remaining(self) -> float:
+        return self.total_sec - (time.monotonic() - self.started)
+
+    def timeout(self, cap: float) -> float:
+        """Per-call timeout: `cap`, clipped to the time left in the run."""
+        left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded(f"run deadline of {self.total_sec:.0f}s exceeded")
+        return min(cap, left)
+
+
+def _call_within(fn: Callable[[float], Any], timeout_sec: float, wait_sec: float) -> Any:
+    """
+    fn(timeout_sec) on a daemon thread, waiting at most `wait_sec` for it.
+    A fetch still running then is abandoned (Python threads can't be killed); being a
+    daemon it never holds up interpreter exit, and its late result is dropped.
+    """
+    box = {}
+
+    def run() -> None:
+        try:
+            box["data"] = fn(timeout_sec)
+        except BaseException as e:  # re-raised in the caller's thread
+            box["error"] = e
+
+    t = threading.Thread(target=run, name="guarded-fetch", daemon=True)
+    t.start()
+    t.join(wait_sec)
+    if t.is_alive():
+        raise DeadlineExceeded(f"still running when the run deadline passed ({wait_sec:.0f}s left)")
+    if "error" in box:
+        raise box["error"]
+    return box.get("data")
+
+
+def _state_path(source: str, kind: str) -> str:
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in source)
+    return os.path.join(STATE_DIR, f"{safe}.{kind}.json")
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path: str, data: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def save_snapshot(source: str, data: Any) -> None:
+    _write_json(_state_path(source, "snapshot"), {"saved_at": time.time(), "data": data})
+
+
+def load_snapshot(source: str) -> Optional[Any]:
+    snap = _read_json(_state_path(source, "snapshot"))
+    return None if snap is None else snap.get("data")
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        source: str,
+        *,
+        failure_threshold: Optional[int] = None,
+        cooldown_sec: Optional[float] = None,
+    ) -> None:
+        self.source = source
+        self.failure_threshold = int(failure_threshold or BREAKER_FAILURES)
+        self.cooldown_sec = float(cooldown_sec or BREAKER_COOLDOWN_SEC)
+        self.path = _state_path(source, "breaker")
+        st = _read_json(self.path) or {}
+        self.state = st.get("state", "closed")
+        self.failures = int(st.get("failures", 0))
+        self.opened_at = float(st.get("opened_at", 0.0))
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.time() - self.opened_at < self.cooldown_sec:
+                return False
+            self.state = "half_open"  # let one probe through
+            self._save()
+        return True
+
+    def record_success(self) -> None:
+        self.state, self.failures, self.opened_at = "closed", 0, 0.0
+        self._save()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state, self.opened_at = "open", time.time()
+        self._save()
+
+    def _save(self) -> None:
+        _write_json(self.path, {"state": self.state, "failures": self.failures, "opened_at": self.opened_at})
+
+
+def guarded_fetch(
+    source: str,
+    fetch: Callable[[float], Any],
+    *,
+    deadline: RunDeadline,
+    timeout_cap: float,
+    valid: Optional[Callable[[Any], bool]] = None,
+) -> Tuple[Optional[Any], bool]:
+    """
+    Call fetch(timeout_sec) behind the source's circuit breaker, waiting no longer than
+    the run deadline allows; a fetch still running then counts as a failure.
+    An empty result (None, {}, []) or one `valid` rejects counts as a failure, so a
+    changed upstream format never overwrites the last good snapshot.
+    Returns (data, fresh): (fresh data, True), else (that snapshot, False); the
+    snapshot is None when the source never succeeded.
+    """
+    try:
+        timeout_sec = deadline.timeout(timeout_cap)
+    except DeadlineExceeded as e:
+        # Not the upstream's fault, so the breaker is left alone
+        print(f"[WARN] {source}: {e}; serving last good snapshot", file=sys.stderr)
+        return load_snapshot(source), False
+
+    breaker = CircuitBreaker(source)
+    if not breaker.allow():
+        print(f"[WARN] {source}: circuit open; serving last good snapshot", file=sys.stderr)
+        return load_snapshot(source), False
+
+    try:
+        data = _call_within(fetch, timeout_sec, deadline.remaining())
+        if not data:
+            raise RuntimeError("fetch returned no data")
+        if valid is not None and not valid(data):
+            raise RuntimeError("fetch returned unusable data (upstream format may have changed)")
+    except Exception as e:
+        breaker.record_failure()
+        print(f"[WARN] {source}: fetch failed ({e}); breaker {breaker.state} "
+              f"after {breaker.failures} failure(s); serving last good snapshot", file=sys.stderr)
+        return load_snapshot(source), False
+
+    breaker.record_success()
+    save_snapshot(source, data)
+    return data, True
@@ -0,0 +1,330 @@
+import codecs
+import json
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import requests
+import profiling
+from config import ES_URL, API_KEY_B64, HEARTBEAT_INDEX
+
+# Bulk plumbing shared by the Windows, macOS and Linux shippers: NDJSON flush with
+# retries, the streamed response parser, the upsert bodies/scripts and heartbeat docs.
+# Each shipper.py only builds its own OS-specific documents on top of this.
+
+
+# Only ask for what we read back: took/errors plus the error of failed items.
+# Successful items filter down to empty objects, which ES drops from the response.
+_BULK_FILTER_PATH = "took,errors,items.*.error"
+
+_JSON_WS = " \t\n\r"
+
+
+def _iter_bulk_response(resp, chunk_size: int = 64 * 1024):
+    """
+    Stream-parse a bulk response body instead of loading it with resp.json().
+    Yields (key, value) for each top-level field; entries of the "items"
+    array are yielded one at a time as ("items", item).
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunks = resp.iter_content(chunk_size=chunk_size)
+    buf, pos, eof = "", 0, False
+
+    def fill() -> None:
+        nonlocal buf, pos, eof
+        chunk = next(chunks, None)
+        buf, pos = buf[pos:], 0  # drop what we already consumed
+        if chunk is None:
+            eof = True
+            buf += utf8.decode(b"", final=True)
+        else:
+            buf += utf8.decode(chunk)
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _JSON_WS:
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return ""
+            fill()
+
+    def expect(ch: str) -> None:
+        nonlocal pos
+        if peek() != ch:
+            raise ValueError(f"Unexpected bulk response near {buf[pos:pos + 40]!r}")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # A value ending exactly at the buffer edge may be truncated (e.g. a number)
+                if end < len(buf) or eof:
+                    pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = value()
+        expect(":")
+        if key == "items" and peek() == "[":
+            pos += 1
+            if peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    yield key, value()
+                    if peek() != ",":
+                        break
+                    pos += 1
+                expect("]")
+        else:
+            yield key, value()
+        if peek() != ",":
+            break
+        pos += 1
+    expect("}")
+
+
+def _bulk_flush(
+    actions: List[dict],
+    docs: List[dict],
+    es_url: str,
+    api_key_b64: str,
+    refresh: Optional[str],
+    max_retries: int,
+    retry_backoff_sec: float,
+) -> Tuple[int, int]:
+    """
+    Sends one NDJSON bulk request.
+    Returns (num_indexed_attempted, num_failed_items).
+    Supports any bulk op (index/update/create/delete) in `actions`.
+    """
+    if not actions:
+        return (0, 0)
+
+    headers = {
+        "Authorization": f"ApiKey {api_key_b64}",
+        "Content-Type": "application/x-ndjson",
+    }
+
+    bulk_url = f"{es_url.rstrip('/')}/_bulk?filter_path={_BULK_FILTER_PATH}"
+    if refresh is not None:
+        bulk_url += f"&refresh={'true' if refresh is True else 'false' if refresh is False else refresh}"
+
+    # Prepare NDJSON payload
+    with profiling.stage("serialize"):
+        lines = []
+        for meta, doc in zip(actions, docs):
+            lines.append(json.dumps(meta, separators=(",", ":")))
+            # For delete ops there is no source line; but we only send bodies for ops that expect them
+            op = next(iter(meta))
+            if op in ("index", "create", "update"):
+                lines.append(json.dumps(doc, separators=(",", ":")))
+        payload = "\n".join(lines) + "\n"
+
+    with profiling.stage("send"):
+        return _bulk_send(bulk_url, payload, headers, len(actions), max_retries, retry_backoff_sec)
+
+
+def _bulk_send(
+    bulk_url: str,
+    payload: str,
+    headers: dict,
+    num_actions: int,
+    max_retries: int,
+    retry_backoff_sec: float,
+) -> Tuple[int, int]:
+    """POST one NDJSON payload, retrying 429/5xx. Returns (num_actions, num_failed_items)."""
+    # Retry transient issues (429/5xx)
+    last_resp = None
+    for attempt in range(1, max_retries + 1):
+        resp = requests.post(bulk_url, data=payload, headers=headers, timeout=120, stream=True)
+        last_resp = resp
+        if resp.status_code == 429 or 500 <= resp.status_code < 600:
+            sleep_for = retry_backoff_sec * (2 ** (attempt - 1))
+            print(f"[WARN] Bulk HTTP {resp.status_code} attempt {attempt}/{max_retries}; "
+                  f"backing off {sleep_for:.1f}s")
+            if attempt < max_retries:
+                resp.close()
+            time.sleep(sleep_for)
+            continue
+        break
+
+    if last_resp is None or not last_resp.ok:
+        msg = f"Bulk failed: HTTP {getattr(last_resp, 'status_code', '???')} {getattr(last_resp, 'text', '')[:500]}"
+        raise RuntimeError(msg)
+
+    took, errors, failed = None, False, 0
+    with last_resp:
+        for key, value in _iter_bulk_response(last_resp):
+            if key == "took":
+                took = value
+            elif key == "errors":
+                errors = value
+            elif key == "items":
+                # item looks like {"update": {"error": {...}}} after filter_path
+                op = next(iter(value))
+                err = (value.get(op) or {}).get("error")
+                if err:
+                    failed += 1
+                    if failed <= 10:
+                        print(f"[ERROR] failed item #{failed}: op={op} error={err}")
+    if not errors:
+        print(f"[OK] Bulk sent {num_actions} ops in {took} ms")
+
+    # Count ops we attempted (one per meta)
+    return (num_actions, failed)
+
+
+def make_bulk_sender(
+    *,
+    es_url: Optional[str] = None,
+    api_key_b64: Optional[str] = None,
+    refresh: Optional[str] = "wait_for",
+    max_retries: int = 3,
+    retry_backoff_sec: float = 1.0,
+):
+    """Return flush_fn(actions, docs) -> (attempted, failed) for pipeline.BulkPipeline."""
+    es_url = es_url or ES_URL
+    api_key_b64 = api_key_b64 or API_KEY_B64
+
+    def flush_fn(actions: List[dict], docs: List[dict]) -> Tuple[int, int]:
+        return _bulk_flush(actions, docs, es_url, api_key_b64, refresh, max_retries, retry_backoff_sec)
+
+    return flush_fn
+
+
+# Content docs only change when their content does. An unchanged upsert becomes a real
+# no-op in the cluster (no reindex, no refresh work); a changed one stamps
+# version_changed_at. Docs written before this existed (no version_changed_at) are
+# rewritten once so they pick the field up. Liveness goes to heartbeat_action() instead.
+# The script is stored once (ensure_upsert_script()), so each bulk action only carries
+# its id and params rather than the Painless source.
+CONTENT_SCRIPT_ID = "os-latest-upsert-if-changed"
+
+_UPSERT_IF_CHANGED = """
+boolean changed = !ctx._source.containsKey('version_changed_at');
+for (def e : params.doc.entrySet()) {
+  if (ctx._source[e.getKey()] != e.getValue()) { changed = true; }
+}
+if (!changed) { ctx.op = 'noop'; return; }
+ctx._source.putAll(params.doc);
+ctx._source.remove('updated_at');
+ctx._source.version_changed_at = params.now;
+ctx._source['@timestamp'] = params.now;
+"""
+
+
+def content_upsert(doc_body: dict, now_iso: str) -> dict:
+    """Bulk UPDATE body that only touches the doc when `doc_body` differs from it."""
+    return {
+        "script": {"id": CONTENT_SCRIPT_ID, "params": {"doc": doc_body, "now": now_iso}},
+        "upsert": {**doc_body, "version_changed_at": now_iso, "@timestamp": now_iso},
+    }
+
+
+# Monotonic mode: the stored script below only applies an update when the incoming version
+# (params.key_fields, compared numerically in order) is newer than the stored one, or equal
+# with different content; older versions are a no-op. With scripted_upsert it also runs for
+# new docs, so concurrent or out-of-order writers can't regress a doc and need no locking.
+MONOTONIC_SCRIPT_ID = "os-latest-monotonic-upsert"
+
+_MONOTONIC_UPSERT = """
+def src = ctx._source;
+int cmp = 0;
+for (int i = 0; i < params.key_fields.size() && cmp == 0; i++) {
+  def f = params.key_fields[i];
+  long cur = src[f] == null ? -1L : ((Number) src[f]).longValue();
+  cmp = Long.compare(((Number) params.doc[f]).longValue(), cur);
+}
+if (cmp < 0) { ctx.op = 'noop'; return; }
+boolean changed = cmp > 0 || !src.containsKey('version_changed_at');
+for (def e : params.doc.entrySet()) {
+  if (src[e.getKey()] != e.getValue()) { changed = true; }
+}
+if (!changed) { ctx.op = 'noop'; return; }
+src.putAll(params.doc);
+src.remove('updated_at');
+src.version_changed_at = params.now;
+src['@timestamp'] = params.now;
+"""
+
+_scripts_ready = set()
+
+
+def ensure_upsert_script(monotonic: bool, es_url: Optional[str] = None, api_key_b64: Optional[str] = None) -> None:
+    """Store (or overwrite) the upsert script for this mode once per process."""
+    script_id, source = (
+        (MONOTONIC_SCRIPT_ID, _MONOTONIC_UPSERT) if monotonic else (CONTENT_SCRIPT_ID, _UPSERT_IF_CHANGED)
+    )
+    if script_id in _scripts_ready:
+        return
+    es_url = es_url or ES_URL
+    api_key_b64 = api_key_b64 or API_KEY_B64
+    resp = requests.put(
+        f"{es_url.rstrip('/')}/_scripts/{script_id}",
+        json={"script": {"lang": "painless", "source": source}},
+        headers={"Authorization": f"ApiKey {api_key_b64}"},
+        timeout=30,
+    )
+    if not resp.ok:
+        raise RuntimeError(f"Storing script {script_id} failed: HTTP {resp.status_code} {resp.text[:500]}")
+    _scripts_ready.add(script_id)
+
+
+def monotonic_upsert(doc_body: dict, now_iso: str, key_fields: List[str]) -> dict:
+    """Bulk UPDATE body that never moves the doc to an older version."""
+    return {
+        "script": {
+            "id": MONOTONIC_SCRIPT_ID,
+            "params": {"doc": doc_body, "now": now_iso, "key_fields": key_fields},
+        },
+        "scripted_upsert": True,
+        "upsert": {},
+    }
+
+
+def heartbeat_action(
+    source_key: str,
+    *,
+    os_name: str,
+    source: Optional[str],
+    docs_checked: int,
+    fresh: bool = True,
+    heartbeat_index: Optional[str] = None,
+) -> Optional[Tuple[dict, dict]]:
+    """
+    One small liveness doc per source (_id = source_key); None when no heartbeat index is set.
+    last_run_at moves every run; last_checked_at only when the upstream was actually fetched
+    (fresh=True), so it keeps its old value while runs serve a last good snapshot.
+    """
+    heartbeat_index = heartbeat_index or HEARTBEAT_INDEX
+    if not heartbeat_index:
+        return None
+    now_iso = datetime.now(timezone.utc).isoformat()
+    doc = {
+        "source_key": source_key,
+        "os": os_name,
+        "source": source,
+        "docs_checked": docs_checked,
+        "served_from_snapshot": not fresh,
+        "last_run_at": now_iso,
+        "@timestamp": now_iso,
+    }
+    if fresh:
+        doc["last_checked_at"] = now_iso
+    # Partial update, so a snapshot run leaves the previous last_checked_at in place
+    return {"update": {"_index": heartbeat_index, "_id": source_key}}, {"doc": doc, "doc_as_upsert": True}
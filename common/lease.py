@@ -0,0 +1,177 @@
+import hashlib
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import requests
+from config import ES_URL, API_KEY_B64, LEASE_INDEX, LEASE_TTL_SEC, LOCK_FILE, WORKER_ID
+
+# Lets several runners of the same pipeline share the work instead of duplicating it.
+#
+# - On every host, a local lock file lets one run at a time through; an overlapping run
+#   on the same host finds the lock held and does nothing. This applies in both modes,
+#   since runs on one host share a WORKER_ID and would otherwise get the same split.
+# - Cluster mode (LEASE_INDEX set): on top of the lock, every runner keeps a lease doc
+#   alive in LEASE_INDEX. Sources are split across runners whose lease has not expired
+#   with rendezvous (highest-random-weight) hashing, so when a runner's lease lapses only
+#   its sources move to the survivors, on their next run.
+
+
+def _rendezvous_score(source: str, worker: str) -> int:
+    digest = hashlib.blake2b(f"{source}|{worker}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def assign_sources(sources: Iterable[str], workers: Iterable[str], worker_id: str) -> List[str]:
+    """
+    Return the subset of `sources` owned by `worker_id` among the live `workers`.
+    Every runner computes the same split from the same worker list.
+    """
+    workers = sorted(set(workers) | {worker_id})
+    return [
+        s for s in sources
+        if max(workers, key=lambda w: _rendezvous_score(str(s), w)) == worker_id
+    ]
+
+
+class Coordinator:
+    """
+    Use as a context manager around a run:
+
+        with Coordinator("linux") as coord:
+            for key in coord.assigned(DISTROS):
+                ...
+    """
+
+    def __init__(
+        self,
+        group: str,
+        *,
+        es_url: Optional[str] = None,
+        api_key_b64: Optional[str] = None,
+        lease_index: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        ttl_sec: Optional[int] = None,
+        lock_file: Optional[str] = None,
+    ) -> None:
+        self.group = group
+        self.es_url = (es_url or ES_URL or "").rstrip("/")
+        self.api_key_b64 = api_key_b64 or API_KEY_B64
+        self.lease_index = lease_index or LEASE_INDEX
+        self.worker_id = worker_id or WORKER_ID or socket.gethostname()
+        self.ttl_sec = int(ttl_sec or LEASE_TTL_SEC)
+        self.lock_file = lock_file or LOCK_FILE or f".{group}.lock"
+        self._lock_fd: Optional[int] = None
+        self._stop = threading.Event()
+        self._renewer: Optional[threading.Thread] = None
+        self.is_active = False
+
+    # ---------- lifecycle ----------
+
+    def __enter__(self) -> "Coordinator":
+        self.is_active = self._try_lock()
+        if not self.is_active:
+            print(f"[INFO] {self.lock_file} is held by another runner; nothing to do.")
+            return self
+        if self.lease_index:
+            try:
+                self._renew()
+            except BaseException:
+                self.__exit__(None, None, None)  # __exit__ does not run when __enter__ raises
+                raise
+            self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+            self._renewer.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join(timeout=5)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # closing the fd releases the lock
+            self._lock_fd = None
+        # The lease is deliberately left to expire rather than deleted: other runners keep
+        # the same split until the TTL passes, so a normal exit between scheduled runs
+        # does not cause a rebalance.
+
+    # ---------- assignment ----------
+
+    def live_workers(self) -> List[str]:
+        if not self.lease_index:
+            return [self.worker_id]
+        now_ms = int(time.time() * 1000)
+        body = {
+            "size": 1000,
+            "_source": ["group", "worker_id"],
+            "query": {"range": {"expires_at_ms": {"gt": now_ms}}},
+        }
+        resp = requests.post(
+            f"{self.es_url}/{self.lease_index}/_search", json=body, headers=self._headers(), timeout=30
+        )
+        resp.raise_for_status()
+        workers = {self.worker_id}
+        for hit in resp.json().get("hits", {}).get("hits", []):
+            src = hit.get("_source") or {}
+            if src.get("group") == self.group and src.get("worker_id"):
+                workers.add(src["worker_id"])
+        return sorted(workers)
+
+    def assigned(self, sources: Iterable[str]) -> List[str]:
+        """Sources this runner should process on this run (empty when inactive)."""
+        sources = list(sources)
+        if not self.is_active:
+            return []
+        workers = self.live_workers()
+        mine = assign_sources(sources, workers, self.worker_id)
+        print(f"[INFO] {self.worker_id}: {len(mine)}/{len(sources)} {self.group} source(s) "
+              f"across {len(workers)} live worker(s)")
+        return mine
+
+    def owns(self, source: str) -> bool:
+        return bool(self.assigned([source]))
+
+    # ---------- internals ----------
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"ApiKey {self.api_key_b64}", "Content-Type": "application/json"}
+
+    def _renew(self) -> None:
+        now = time.time()
+        doc = {
+            "group": self.group,
+            "worker_id": self.worker_id,
+            "renewed_at_ms": int(now * 1000),
+            "expires_at_ms": int((now + self.ttl_sec) * 1000),
+        }
+        _id = f"{self.group}:{self.worker_id}"
+        resp = requests.put(
+            f"{self.es_url}/{self.lease_index}/_doc/{_id}?refresh=wait_for",
+            json=doc, headers=self._headers(), timeout=30,
+        )
+        resp.raise_for_status()
+
+    def _renew_loop(self) -> None:
+        # Keep the lease alive while a long run is still going
+        while not self._stop.wait(max(self.ttl_sec / 3, 1)):
+            try:
+                self._renew()
+            except requests.RequestException as e:
+                print(f"[WARN] lease renewal failed: {e}", file=sys.stderr)
+
+    def _try_lock(self) -> bool:
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except ImportError:  # Windows host
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
@@ -0,0 +1,128 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+# Overlaps upstream fetches with bulk indexing.
+#
+# Fetchers run in a small thread pool and their results are handed over as each source
+# completes; a single shipping thread fills bulk batches from a bounded queue and sends
+# them while the fetches are still running. When the cluster is slower than the
+# upstreams the queue fills up and submit() blocks, so memory stays bounded.
+
+FlushFn = Callable[[List[dict], List[dict]], Tuple[int, int]]
+
+_DONE = object()
+
+
+def fetch_concurrently(
+    fetch: Callable[..., Any],
+    args_list: Iterable[tuple],
+    *,
+    max_workers: int = 4,
+) -> Iterator[Tuple[tuple, Any]]:
+    """Run fetch(*args) for each args tuple and yield (args, result) as each one completes."""
+    args_list = list(args_list)
+    if not args_list:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(args_list)))) as pool:
+        futures = {pool.submit(fetch, *args): args for args in args_list}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+
+
+class BulkPipeline:
+    """
+    Background shipping stage.
+
+        with BulkPipeline(flush_fn, batch_size=500) as pipe:
+            for meta, body in actions:
+                pipe.submit(meta, body)
+        print(pipe.total, pipe.failed)
+
+    `flush_fn(actions, docs)` sends one bulk request and returns (attempted, failed),
+    like bulk.make_bulk_sender()'s flush_fn. A partial batch is sent once the queue has been idle
+    for `linger_sec`, so documents go out as soon as their source finished.
+    """
+
+    def __init__(
+        self,
+        flush_fn: FlushFn,
+        *,
+        batch_size: int = 500,
+        max_queue: int = 5000,
+        linger_sec: float = 0.5,
+    ) -> None:
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.linger_sec = linger_sec
+        self.total = 0
+        self.failed = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="bulk-shipper", daemon=True)
+        self._thread.start()
+
+    def submit(self, meta: dict, body: dict) -> None:
+        """Queue one action; blocks while the queue is full (backpressure)."""
+        if self._error is not None:
+            raise RuntimeError("bulk shipping stage failed") from self._error
+        self._queue.put((meta, body))
+
+    def submit_all(self, actions: Iterable[Tuple[dict, dict]]) -> None:
+        for meta, body in actions:
+            self.submit(meta, body)
+
+    def close(self) -> Tuple[int, int]:
+        """Send whatever is left, stop the shipping thread and return (total, failed)."""
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("bulk shipping stage failed") from self._error
+        return self.total, self.failed
+
+    def __enter__(self) -> "BulkPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # Still drain what we have, but let the original exception propagate
+            self._queue.put(_DONE)
+            self._thread.join()
+
+    def _run(self) -> None:
+        actions: List[dict] = []
+        docs: List[dict] = []
+
+        def flush() -> None:
+            n_attempted, n_failed = self.flush_fn(actions, docs)
+            self.total += n_attempted
+            self.failed += n_failed
+            actions.clear()
+            docs.clear()
+
+        done = False
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.linger_sec if actions else None)
+                except queue.Empty:
+                    flush()  # producers are idle: don't hold a partial batch back
+                    continue
+                if item is _DONE:
+                    done = True
+                    break
+                meta, body = item
+                actions.append(meta)
+                docs.append(body)
+                if len(actions) >= self.batch_size:
+                    flush()
+            if actions:
+                flush()
+        except BaseException as e:  # surfaced to the producer on submit()/close()
+            self._error = e
+            # Keep consuming so a producer blocked on a full queue can't hang
+            while not done:
+                done = self._queue.get() is _DONE
@@ -0,0 +1,217 @@
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+# Opt-in profiling for production-like runs:  python main.py --profile[=DIR]
+#
+# Code marks its stages with `with profiling.stage("parse"): ...`; that is a no-op unless
+# --profile was given. When on, each stage gets its own cProfile profiler plus tracemalloc
+# peak tracking. At exit, one merged <stage>.pstats per stage and summary.txt (top functions
+# and allocation sites per stage) are written to DIR (default: ./profile-<timestamp>).
+#
+# Stage names used across the pipelines: fetch, parse, build, serialize, send.
+# Nested stages pause the outer stage's profiler. The outer stage's wall time and peak still
+# include the nested stage's work, but not its snapshots: the outer peak is tracked in
+# windows around each nested stage, and the nested snapshot time is subtracted.
+# Only one profiler can be active at a time on Python 3.12+; a stage that overlaps one in
+# another thread records time and memory only. tracemalloc's peak is process-wide, so a
+# stage's peak is only recorded when no stage in another thread ran during it; stages that
+# always overlapped one (e.g. "send" on the shipping thread) show "-".
+# Allocation sites are snapshot diffs, so they also include what nested and overlapping
+# stages allocated.
+
+_TOP_N = 10
+_MAX_SNAPSHOTS = 5  # allocation-site snapshots per stage; they are expensive
+# Keep the profiler's own allocations (snapshots, tracebacks) out of the site tables
+_SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+class _StageStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall_sec = 0.0
+        self.peak_bytes: Optional[int] = None  # None: never ran alone
+        self.stats: Optional[pstats.Stats] = None
+        self.alloc_sites: Dict[str, int] = {}
+        self.snapshots = 0
+
+
+class _Frame:
+    """One running stage on a thread's stack."""
+
+    __slots__ = ("prof", "alone", "epoch", "mem_start", "peak", "overhead_sec")
+
+    def __init__(self, prof: Optional[cProfile.Profile], alone: bool, epoch: int, mem_start: int) -> None:
+        self.prof = prof
+        self.alone = alone
+        self.epoch = epoch
+        self.mem_start = mem_start
+        self.peak = mem_start    # highest traced memory seen so far in this stage's own windows
+        self.overhead_sec = 0.0  # nested stages' snapshot/bookkeeping time, not the stage's own
+
+
+class Profiler:
+    def __init__(self, out_dir: str) -> None:
+        self.out_dir = out_dir
+        self.stages: Dict[str, _StageStats] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._busy_threads = 0  # threads inside at least one stage right now
+        self._epoch = 0         # bumped whenever a thread enters its outermost stage
+
+    def _stack(self) -> List[_Frame]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str):
+        t_enter = time.perf_counter()
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        parent_mem = 0
+        if parent is not None:
+            if parent.prof is not None:
+                parent.prof.disable()  # pause the outer stage
+            if parent.alone:
+                # The outer stage's current peak window ends here; keep what it saw
+                parent_mem, peak = tracemalloc.get_traced_memory()
+                parent.peak = max(parent.peak, peak)
+
+        with self._lock:
+            st = self.stages.setdefault(name, _StageStats())
+            take_snapshot = st.snapshots < _MAX_SNAPSHOTS
+            st.snapshots += take_snapshot
+        # Snapshots allocate too, so they are taken outside the peak window
+        before = _snapshot() if take_snapshot else None
+        with self._lock:
+            if parent is None:
+                alone = self._busy_threads == 0
+                self._busy_threads += 1
+                self._epoch += 1
+            else:
+                alone = self._busy_threads == 1  # only this thread
+            epoch = self._epoch
+            if alone:
+                tracemalloc.reset_peak()
+            mem_start = tracemalloc.get_traced_memory()[0]
+
+        prof: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:  # another thread's stage holds the profiler (3.12+)
+            prof = None
+        frame = _Frame(prof, alone, epoch, mem_start)
+        stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            t_end = time.perf_counter()
+            elapsed = t_end - t0 - frame.overhead_sec
+            if prof is not None:
+                prof.disable()
+            stack.pop()
+            mem_peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            sites = {}
+            if before is not None:
+                for diff in _snapshot().compare_to(before, "lineno")[:_TOP_N]:
+                    if diff.size_diff > 0:
+                        sites[str(diff.traceback)] = diff.size_diff
+                before = None  # free it before the outer stage's next peak window
+
+            with self._lock:
+                if parent is None:
+                    self._busy_threads -= 1
+                if alone and self._epoch == epoch:
+                    st.peak_bytes = max(st.peak_bytes or 0, mem_peak - mem_start)
+                st.calls += 1
+                st.wall_sec += elapsed
+                for site, size in sites.items():
+                    st.alloc_sites[site] = st.alloc_sites.get(site, 0) + size
+                if prof is not None:
+                    if st.stats is None:
+                        st.stats = pstats.Stats(prof)
+                    else:
+                        st.stats.add(prof)
+
+            if parent is not None:
+                if parent.alone:
+                    # This stage's peak happened inside the outer one too, on top of what the
+                    # outer stage held when it started (our own "before" snapshot excluded);
+                    # then start the outer stage's next window after our snapshots
+                    parent.peak = max(parent.peak, parent_mem + mem_peak - mem_start)
+                    tracemalloc.reset_peak()
+                # Everything spent here outside our own measured time is profiler cost
+                parent.overhead_sec += (t0 - t_enter) + frame.overhead_sec + (time.perf_counter() - t_end)
+                if parent.prof is not None:
+                    try:
+                        parent.prof.enable()  # resume the outer stage
+                    except ValueError:
+                        pass
+
+    def report(self) -> None:
+        os.makedirs(self.out_dir, exist_ok=True)
+        out = io.StringIO()
+        out.write(f"{'stage':<12}{'calls':>8}{'wall s':>10}{'peak MiB':>10}\n")
+        for name, st in self.stages.items():
+            peak = "-" if st.peak_bytes is None else f"{st.peak_bytes / 2**20:.2f}"
+            out.write(f"{name:<12}{st.calls:>8}{st.wall_sec:>10.3f}{peak:>10}\n")
+        out.write("peak MiB: measured only while the stage ran alone (tracemalloc peaks are process-wide)\n")
+
+        for name, st in self.stages.items():
+            out.write(f"\n=== {name}: top functions (cumulative) ===\n")
+            if st.stats is not None:
+                st.stats.dump_stats(os.path.join(self.out_dir, f"{name}.pstats"))
+                st.stats.stream = out
+                st.stats.sort_stats("cumulative").print_stats(_TOP_N)
+            else:
+                out.write("(no CPU profile: overlapped another profiled stage)\n")
+            out.write(f"=== {name}: top allocation sites ===\n")
+            top = sorted(st.alloc_sites.items(), key=lambda kv: kv[1], reverse=True)[:_TOP_N]
+            for site, size in top:
+                out.write(f"{size / 1024:>10.1f} KiB  {site}\n")
+
+        text = out.getvalue()
+        with open(os.path.join(self.out_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        print(text)
+        print(f"[OK] profile written to {self.out_dir}")
+
+
+_ACTIVE: Optional[Profiler] = None
+
+
+def stage(name: str):
+    """Context manager around one pipeline stage; free when profiling is off."""
+    return _ACTIVE.stage(name) if _ACTIVE is not None else nullcontext()
+
+
+def enable_from_argv(argv: Optional[List[str]] = None) -> Optional[Profiler]:
+    """Turn profiling on if --profile / --profile=DIR is on the command line."""
+    global _ACTIVE
+    argv = sys.argv[1:] if argv is None else argv
+    out_dir = None
+    for arg in argv:
+        if arg == "--profile":
+            out_dir = f"profile-{time.strftime('%Y%m%d-%H%M%S')}"
+        elif arg.startswith("--profile="):
+            out_dir = arg.split("=", 1)[1]
+    if out_dir is None:
+        return None
+    tracemalloc.start()
+    _ACTIVE = Profiler(out_dir)
+    atexit.register(_ACTIVE.report)
+    return _ACTIVE
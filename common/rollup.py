@@ -0,0 +1,96 @@
+import copy
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from config import ES_URL, API_KEY_B64, ROLLUP_INDEX, ROLLUP_ID
+
+# One precomputed "current supported versions" doc for dashboards and alert rules:
+#   GET <ROLLUP_INDEX>/_doc/<ROLLUP_ID>
+#   {"windows11": {"26200": {"latest_build": "26200.6899", ...}, ...},
+#    "macos":     {"tahoe": {"latest_version": "26.0.1", ...}, ...},
+#    "linux":     {"ubuntu": {"24": {"latest_version": "24.04.3", ...}, ...}, ...},
+#    "updated_at": "...", "@timestamp": "..."}
+#
+# Each pipeline re-reads its own docs after shipping and replaces only its section(s).
+# The doc is written only when a section actually changed, using if_seq_no /
+# if_primary_term, so the three pipelines can update it concurrently without losing writes.
+
+_MAX_ATTEMPTS = 5
+
+
+def _headers() -> dict:
+    return {"Authorization": f"ApiKey {API_KEY_B64}", "Content-Type": "application/json"}
+
+
+def read_section(index: str, query: dict, key_field: str, fields: List[str]) -> Dict[str, dict]:
+    """{str(doc[key_field]): {field: doc[field]}} for every doc matching `query` in `index`."""
+    resp = requests.post(
+        f"{ES_URL.rstrip('/')}/{index}/_search",
+        json={"size": 1000, "_source": [key_field] + fields, "query": query},
+        headers=_headers(), timeout=30,
+    )
+    if not resp.ok:
+        raise RuntimeError(f"Rollup read from '{index}' failed: HTTP {resp.status_code} {resp.text[:500]}")
+    section = {}
+    for hit in (resp.json().get("hits") or {}).get("hits") or []:
+        src = hit.get("_source") or {}
+        if src.get(key_field) is not None:
+            section[str(src[key_field])] = {f: src.get(f) for f in fields}
+    return section
+
+
+def _set_path(doc: dict, path: Tuple[str, ...], value: Any) -> None:
+    for key in path[:-1]:
+        doc = doc.setdefault(key, {})
+    doc[path[-1]] = value
+
+
+def update_rollup(
+    sections: Dict[Tuple[str, ...], dict],
+    *,
+    index: Optional[str] = None,
+    doc_id: Optional[str] = None,
+) -> bool:
+    """
+    Replace the given sections (path tuple -> value) of the rollup doc.
+    Returns True if the doc was written, False if nothing changed.
+    """
+    index = index or ROLLUP_INDEX
+    doc_id = doc_id or ROLLUP_ID
+    base = f"{ES_URL.rstrip('/')}/{index}/_doc/{doc_id}"
+
+    for _ in range(_MAX_ATTEMPTS):
+        resp = requests.get(base, headers=_headers(), timeout=30)
+        if resp.status_code == 404:
+            current, params = {}, {"op_type": "create"}
+        elif resp.ok:
+            got = resp.json()
+            current = got.get("_source") or {}
+            params = {"if_seq_no": got["_seq_no"], "if_primary_term": got["_primary_term"]}
+        else:
+            raise RuntimeError(f"Rollup read failed: HTTP {resp.status_code} {resp.text[:500]}")
+
+        new = copy.deepcopy(current)
+        for path, value in sections.items():
+            _set_path(new, path, value)
+        if new == current:
+            print(f"[OK] Rollup '{index}/{doc_id}' unchanged")
+            return False
+
+        now_iso = datetime.now(timezone.utc).isoformat()
+        new["updated_at"] = now_iso
+        new["@timestamp"] = now_iso
+        put = requests.put(base, params={**params, "refresh": "wait_for"}, json=new,
+                           headers=_headers(), timeout=30)
+        if put.status_code == 409:
+            continue  # another pipeline wrote in between: re-read and re-apply
+        if not put.ok:
+            raise RuntimeError(f"Rollup write failed: HTTP {put.status_code} {put.text[:500]}")
+        print(f"[OK] Rollup '{index}/{doc_id}' updated: {', '.join('.'.join(p) for p in sections)}")
+        return True
+
+    print(f"[WARN] Rollup '{index}/{doc_id}' not updated: kept conflicting after {_MAX_ATTEMPTS} attempts",
+          file=sys.stderr)
+    return False
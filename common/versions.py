@@ -0,0 +1,127 @@
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, Iterable, Tuple, TypeVar
+
+# One version type for every fetcher and shipper (macOS and Linux).
+#
+# Version is a tuple subclass, so sorting / max() compare plain tuples in C:
+#   (release, is_final, prerelease)
+# - release: numeric parts with trailing zeros trimmed ("24.04" == "24.04.0", "0" -> (0,));
+#   unparseable input gets the empty release (), which sorts below every real version
+# - is_final: 1 for releases, 0 for pre-releases, so "26.1-beta2" < "26.1"
+# - prerelease: identifiers as (0, int) / (1, rank, str), numbers before text (SemVer order);
+#   labels rank dev < alpha < beta < preview < rc, unknown labels after those by string order
+# A label only counts as a whole token ("rc1", "-beta.2", "b3"), so suffixes that merely start
+# with a/b ("-build5", "-arm64", "-amd64") are build metadata, like "+build.5" or " (24G231)":
+# accepted and ignored, so they never affect ordering.
+
+_VERSION_RE = re.compile(
+    r"""^\s*v?
+        (?P<release>\d+(?:\.\d+)*)
+        (?:[-.~]?(?P<pre>(?:alpha|beta|preview|pre|rc|dev|a|b)(?![A-Za-z])(?:[-.]?\d+)?(?:\.[0-9A-Za-z]+)*))?
+    """,
+    re.I | re.X,
+)
+
+_PRE_ALIASES = {"a": "alpha", "b": "beta", "pre": "preview"}
+_PRE_RANK = {"dev": 0, "alpha": 1, "beta": 2, "preview": 3, "rc": 4}
+
+
+def _pre_identifiers(pre: str) -> Tuple[tuple, ...]:
+    ids = []
+    for part in re.findall(r"[A-Za-z]+|\d+", pre):
+        if part.isdigit():
+            ids.append((0, int(part)))
+        else:
+            part = part.lower()
+            part = _PRE_ALIASES.get(part, part)
+            ids.append((1, _PRE_RANK.get(part, len(_PRE_RANK)), part))
+    return tuple(ids)
+
+
+class Version(tuple):
+    __slots__ = ()
+
+    def __new__(cls, raw: str) -> "Version":
+        return parse_version(raw)
+
+    @classmethod
+    def _make(cls, release, is_final, pre) -> "Version":
+        return tuple.__new__(cls, (release, is_final, pre))
+
+    @property
+    def release(self) -> Tuple[int, ...]:
+        return self[0]
+
+    @property
+    def is_prerelease(self) -> bool:
+        return not self[1]
+
+    def parts(self, width: int = 3) -> Tuple[int, ...]:
+        """Release padded / truncated to `width` ints, e.g. (major, minor, patch)."""
+        rel = self[0][:width]
+        return rel + (0,) * (width - len(rel))
+
+    @property
+    def major(self) -> int:
+        return self.parts(1)[0]
+
+    @property
+    def minor(self) -> int:
+        return self.parts(2)[1]
+
+    @property
+    def patch(self) -> int:
+        return self.parts(3)[2]
+
+    def __repr__(self) -> str:
+        return f"Version(release={self[0]!r}, prerelease={self[2]!r})"
+
+
+# Empty release: below every parsed version, including "0"
+_UNPARSEABLE = Version._make((), 1, ())
+
+
+@lru_cache(maxsize=65536)
+def parse_version(raw: str) -> Version:
+    """
+    Parse '24.04.3', '26.0.1', '25.10', '26.1-beta2', '1.0.0-rc.1+build.5',
+    '15.7.1 (24G231)'. Unparseable strings sort below every real version.
+    Results are cached, so repeated comparisons never re-parse.
+    """
+    raw = str(raw).strip()
+    m = _VERSION_RE.match(raw)
+    if not m:
+        return _UNPARSEABLE
+    release = tuple(int(x) for x in m.group("release").split("."))
+    while len(release) > 1 and release[-1] == 0:
+        release = release[:-1]
+    pre = m.group("pre")
+    return Version._make(
+        release,
+        0 if pre else 1,
+        _pre_identifiers(pre) if pre else (),
+    )
+
+
+T = TypeVar("T")
+
+
+def max_per_group(
+    items: Iterable[T],
+    group: Callable[[T], Hashable],
+    version: Callable[[T], str],
+) -> Dict[Hashable, T]:
+    """
+    Keep the item with the highest version per group in one pass.
+    Each group's current best version is kept parsed, so every item costs
+    one cached parse and one tuple comparison.
+    """
+    best: Dict[Hashable, Tuple[Version, T]] = {}
+    for it in items:
+        key = group(it)
+        v = parse_version(version(it))
+        cur = best.get(key)
+        if cur is None or v > cur[0]:
+            best[key] = (v, it)
+    return {k: it for k, (_, it) in best.items()}
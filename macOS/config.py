@@ -1,15 +1,46 @@
 # config.py
 from pathlib import Path
 from dotenv import load_dotenv
-import os, re, ast
+import os, re, ast, sys
 
 # Always resolve path so it works no matter where you run from
 ENV_PATH = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=ENV_PATH)  # set override=True if you want .env to win over OS env
 
+# Code shared by the three pipelines lives in ../common and reads its settings from this
+# module, so every module here imports config before anything from common/. It goes first
+# on sys.path so an installed distribution with the same name (profiling, versions, ...)
+# can't shadow it; common/ has no config.py, so this folder's config still wins.
+COMMON_DIR = Path(__file__).resolve().parent.parent / "common"
+if str(COMMON_DIR) not in sys.path:
+    sys.path.insert(0, str(COMMON_DIR))
+
 
 ES_URL = (os.getenv("ES_URL"))
 API_KEY_B64 = os.getenv("API_KEY_B64")
 
 RELEASE_INFO_URL = os.getenv("RELEASE_INFO_URL")
 DEST_INDEX = os.getenv("DEST_INDEX")
+
+# Running several runners side by side (see common/lease.py).
+# LEASE_INDEX unset -> single-host mode. LOCK_FILE guards overlapping runs on a host either way.
+LEASE_INDEX = os.getenv("LEASE_INDEX")
+LEASE_TTL_SEC = int(os.getenv("LEASE_TTL_SEC", "900"))  # keep above the schedule interval
+WORKER_ID = os.getenv("WORKER_ID")                      # defaults to the hostname
+LOCK_FILE = os.getenv("LOCK_FILE", str(Path(__file__).resolve().parent / ".runner.lock"))
+
+# Upstream protection (see common/breaker.py)
+STATE_DIR = os.getenv("STATE_DIR", str(Path(__file__).resolve().parent / ".state"))  # breaker state + last good snapshots
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))         # consecutive failures before opening
+BREAKER_COOLDOWN_SEC = int(os.getenv("BREAKER_COOLDOWN_SEC", "900"))  # open -> half-open probe after this
+RUN_DEADLINE_SEC = int(os.getenv("RUN_DEADLINE_SEC", "120"))       # total budget for all fetches in a run
+
+# Liveness: one small "last checked" doc per source, kept out of the versioned content docs
+HEARTBEAT_INDEX = os.getenv("HEARTBEAT_INDEX") or (f"{DEST_INDEX}_heartbeat" if DEST_INDEX else None)
+
+# Scripted "monotonic max" upserts: a stale writer can never roll a version back
+MONOTONIC_UPSERTS = os.getenv("MONOTONIC_UPSERTS", "").strip().lower() in ("1", "true", "yes")
+
+# Cross-OS "current latest" rollup doc (see common/rollup.py); unset ROLLUP_INDEX to skip it
+ROLLUP_INDEX = os.getenv("ROLLUP_INDEX")
+ROLLUP_ID = os.getenv("ROLLUP_ID", "current")
@@ -2,22 +2,30 @@ import json
 from urllib.request import Request, urlopen
 from typing import Dict
 from config import RELEASE_INFO_URL
+from versions import max_per_group
+import profiling
 #https://endoflife.date/api/v1/products/macos/
 
-def get_maintained_macos_latest_by_codename() -> Dict[str, str]:
+def get_maintained_macos_latest_by_codename(timeout_sec: float = 20) -> Dict[str, str]:
     """
     Returns a mapping like:
       {"tahoe": "26.0.1", "sequoia": "15.7.1", "sonoma": "14.8.1"}
     for all *maintained* macOS releases.
     """
     req = Request(RELEASE_INFO_URL, headers={"Accept": "application/json"})
-    with urlopen(req, timeout=20) as resp:
-        if resp.status != 200:
-            raise RuntimeError(f"Fetch failed: {resp.status} {resp.reason}")
-        data = json.load(resp)
+    with profiling.stage("fetch"):
+        with urlopen(req, timeout=timeout_sec) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Fetch failed: {resp.status} {resp.reason}")
+            raw = resp.read()
 
+    with profiling.stage("parse"):
+        return _latest_by_codename(json.loads(raw))
+
+
+def _latest_by_codename(data: dict) -> Dict[str, str]:
     releases = (data.get("result") or {}).get("releases") or []
-    mapping: Dict[str, str] = {}
+    pairs = []
 
     for r in releases:
         if not r.get("isMaintained"):
@@ -27,8 +35,11 @@ def get_maintained_macos_latest_by_codename() -> Dict[str, str]:
         if not codename or not latest_name:
             continue
 
-        key = codename.lower()  # normalize to "tahoe", "sequoia", "sonoma"
-        if key not in mapping:   # de-dupe, preserve first-seen order
-            mapping[key] = str(latest_name).strip()
+        # normalize to "tahoe", "sequoia", "sonoma"
+        pairs.append((codename.lower(), str(latest_name).strip()))
+
+    # de-dupe, keeping the highest version per codename (first-seen order preserved)
+    latest = max_per_group(pairs, group=lambda p: p[0], version=lambda p: p[1])
+    mapping: Dict[str, str] = {key: version for key, version in latest.values()}
 
     return mapping
@@ -1,7 +1,39 @@
+import sys
+
+from config import DEST_INDEX, MONOTONIC_UPSERTS, RELEASE_INFO_URL, ROLLUP_INDEX
 from fetch_latest_version import get_maintained_macos_latest_by_codename
-from shipper import ship_macos_latest
-from config import DEST_INDEX
+from shipper import macos_latest_actions, update_latest_rollup
+from bulk import ensure_upsert_script, heartbeat_action, make_bulk_sender
+from lease import Coordinator
+import profiling
+from pipeline import BulkPipeline
+from breaker import RunDeadline, guarded_fetch
+
+SOURCE = "endoflife-macos"
 
 if __name__ == "__main__":
-    latest = get_maintained_macos_latest_by_codename()
-    ship_macos_latest(latest, dest_index=DEST_INDEX, refresh="wait_for")
\ No newline at end of file
+    profiling.enable_from_argv()  # --profile[=DIR]
+    # One upstream product: whichever live runner owns it fetches and ships
+    latest = {}
+    with Coordinator("macos") as coord, BulkPipeline(make_bulk_sender(refresh="wait_for")) as pipe:
+        if coord.owns(SOURCE):
+            latest, fresh = guarded_fetch(SOURCE, get_maintained_macos_latest_by_codename,
+                                          deadline=RunDeadline(), timeout_cap=20)
+            if latest is None:
+                print("[ERR] No fresh data and no last good snapshot for endoflife.date.", file=sys.stderr)
+            else:
+                ensure_upsert_script(MONOTONIC_UPSERTS)
+                with profiling.stage("build"):
+                    actions = list(macos_latest_actions(latest, dest_index=DEST_INDEX, monotonic=MONOTONIC_UPSERTS))
+                pipe.submit_all(actions)
+                heartbeat = heartbeat_action("macos", os_name="macos", source=RELEASE_INFO_URL,
+                                             docs_checked=len(latest), fresh=fresh)
+                if heartbeat:
+                    pipe.submit(*heartbeat)
+    print(f"[DONE] Upserted {pipe.total} macOS doc(s) into '{DEST_INDEX}'. Failures: {pipe.failed}")
+
+    # One GET-able "current latest" doc for dashboards, rewritten only when a section changed
+    if ROLLUP_INDEX and latest and not pipe.failed:
+        update_latest_rollup(latest, DEST_INDEX)
+    if latest is None:
+        sys.exit(1)
@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+
+import pytest  # noqa: E402
+from versions import max_per_group, parse_version  # noqa: E402
+
+
+def test_prerelease_labels_rank_below_final():
+    chain = ["26.1-dev1", "26.1-alpha1", "26.1-beta2", "26.1-preview", "26.1-rc1", "26.1"]
+    assert sorted(chain, key=parse_version, reverse=True) == chain[::-1]
+    assert [parse_version(v) for v in chain] == sorted(parse_version(v) for v in chain)
+
+
+def test_prerelease_aliases_and_numbers():
+    assert parse_version("26.1b2") == parse_version("26.1-beta2")
+    assert parse_version("26.1a1") == parse_version("26.1-alpha.1")
+    assert parse_version("1.0.0-rc.2") < parse_version("1.0.0-rc.10")
+
+
+@pytest.mark.parametrize("raw", ["1.0-build5", "1.0-arm64", "1.0-amd64", "1.0+build.5", "1.0 (24G231)"])
+def test_build_metadata_is_ignored(raw):
+    v = parse_version(raw)
+    assert not v.is_prerelease
+    assert v == parse_version("1.0")
+
+
+def test_prerelease_keeps_label_before_build_metadata():
+    assert parse_version("1.0-beta-arm64") == parse_version("1.0-beta")
+    assert parse_version("1.0.0-rc.1+build.5") == parse_version("1.0.0-rc.1")
+
+
+def test_trailing_zeros_and_unparseable():
+    assert parse_version("24.04") == parse_version("24.04.0")
+    assert parse_version("0") > parse_version("not-a-version")
+    assert parse_version("0").parts() == (0, 0, 0)
+
+
+def test_max_per_group():
+    items = [
+        {"name": "ubuntu", "v": "24.04.1"},
+        {"name": "ubuntu", "v": "24.10-beta"},
+        {"name": "ubuntu", "v": "24.04.10"},
+        {"name": "debian", "v": "12"},
+        {"name": "debian", "v": "garbage"},
+    ]
+    best = max_per_group(items, group=lambda it: it["name"], version=lambda it: it["v"])
+    assert best["ubuntu"]["v"] == "24.10-beta"
+    assert best["debian"]["v"] == "12"
+
+
+def test_max_per_group_keeps_first_of_equal_versions():
+    items = [("a", "1.0", 1), ("a", "1.0.0", 2), ("a", "1.0-build5", 3)]
+    best = max_per_group(items, group=lambda it: it[0], version=lambda it: it[1])
+    assert best["a"][2] == 1